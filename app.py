@@ -1,78 +1,253 @@
 import streamlit as st
 import pandas as pd
-from fpdf import FPDF
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import PromptTemplate
+import numpy as np
 from dotenv import load_dotenv
 import os
+from concurrent.futures import ThreadPoolExecutor
+import io
+import hashlib
 
 load_dotenv()
 
+# --- OPTIONAL FAST CSV PARSING (PYARROW) ---
+# Opt-in via USE_PYARROW_IO=1; falls back to the default pandas reader if pyarrow is absent.
+USE_PYARROW_IO = os.getenv("USE_PYARROW_IO") == "1"
+if USE_PYARROW_IO:
+    try:
+        import pyarrow as pa
+        from pyarrow import csv as pacsv
+    except ImportError:
+        USE_PYARROW_IO = False
+
+# --- OPTIONAL COLUMNAR ENGINE (POLARS) ---
+# Opt-in via USE_POLARS=1; the NumPy aggregation path is used if polars is absent.
+USE_POLARS = os.getenv("USE_POLARS") == "1"
+if USE_POLARS:
+    try:
+        import polars as pl
+    except ImportError:
+        USE_POLARS = False
+
 # --- CONFIGURATION ---
 st.set_page_config(page_title="AdPulse | Automated Insights", page_icon="📊", layout="centered")
 
 # --- Gemini API KEY from ENV ---
 api_key = os.getenv("GEMINI_API_KEY")
 
+# --- DATA INGESTION ---
+# Only the columns the analysis reads are parsed; everything else is skipped.
+# Nullable dtypes so blank cells load as missing values instead of failing the parse. Metrics
+# are all floats: attributed conversions can be fractional, and "100.0" must parse everywhere.
+CSV_DTYPES = {
+    'Impressions': 'Float64',
+    'Clicks': 'Float64',
+    'Spend': 'Float64',
+    'Conversions': 'Float64',
+    'Campaign_Name': 'string',
+    'Platform': 'category'
+}
+
+def _csv_columns(raw):
+    # Header names of the analysed columns present in the upload, in file order. Read by
+    # Arrow's own streaming reader (first block only, no copy) so it parses like read_csv.
+    header = pacsv.open_csv(pa.BufferReader(raw)).schema.names
+    return [col for col in header if col in CSV_DTYPES]
+
+def _arrow_type(dtype):
+    # Arrow equivalent of a CSV_DTYPES entry
+    return {
+        'Float64': pa.float64(),
+        'string': pa.string(),
+        'category': pa.dictionary(pa.int32(), pa.string())
+    }[dtype]
+
+def load_csv(raw):
+    """
+    Parses the uploaded CSV bytes. Uses the multithreaded Arrow parser when USE_PYARROW_IO is enabled,
+    in which case the Arrow table is returned as-is and only converted to pandas for aggregation.
+    """
+    try:
+        if USE_PYARROW_IO:
+            # BufferReader gives Arrow a flat view of the bytes, with no Python file-protocol reads
+            table = pacsv.read_csv(
+                pa.BufferReader(raw),
+                convert_options=pacsv.ConvertOptions(
+                    include_columns=_csv_columns(raw),
+                    # Same schema as the pandas path so both readers accept the same files
+                    column_types={col: _arrow_type(dtype) for col, dtype in CSV_DTYPES.items()}
+                )
+            )
+            return table, None
+        # A callable usecols tolerates absent columns so validation can report them later
+        return pd.read_csv(io.BytesIO(raw), usecols=lambda col: col in CSV_DTYPES, dtype=CSV_DTYPES), None
+
+    except Exception as e:
+        return None, f"Data Processing Error: {str(e)}"
+
+# Bounded so parsed uploads and their stats don't accumulate in process memory
+CSV_CACHE_MAX_ENTRIES = 16
+CSV_CACHE_TTL = 3600  # seconds
+
+@st.cache_data(show_spinner=False, max_entries=CSV_CACHE_MAX_ENTRIES, ttl=CSV_CACHE_TTL)
+def _load_csv(csv_key: str, _raw: bytes):
+    # Keyed on the upload's content digest so reruns and re-uploads skip parsing entirely
+    return load_csv(_raw)
+
 # --- CORE LOGIC (PANDAS) ---
+METRIC_COLS = ['Impressions', 'Clicks', 'Spend', 'Conversions']
+
+@st.cache_resource(show_spinner=False)
+def _get_fused_stats():
+    # Optional JIT kernel, used automatically when numba is installed; otherwise the plain
+    # NumPy reductions run. Imported and compiled on the first report, not at startup.
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    @numba.njit
+    def _fused_stats(imp, clk, spn, cnv):
+        # Totals, top-conversion row and best ROAS row in a single pass with no temporaries
+        s_imp = s_clk = s_spn = s_cnv = 0.0
+        best_conv = -1.0
+        i_conv = 0
+        best_roas = -1.0
+        i_roas = -1  # stays -1 when no row has positive spend
+        for i in range(imp.shape[0]):
+            s_imp += imp[i]
+            s_clk += clk[i]
+            s_spn += spn[i]
+            s_cnv += cnv[i]
+            if cnv[i] > best_conv:
+                best_conv = cnv[i]
+                i_conv = i
+            if spn[i] > 0 and cnv[i] / spn[i] > best_roas:
+                best_roas = cnv[i] / spn[i]
+                i_roas = i
+        return s_imp, s_clk, s_spn, s_cnv, i_conv, i_roas
+
+    return _fused_stats
+
+def _aggregate_numpy(df):
+    # Column-major float64 layout so each metric is a contiguous view; every column is fetched
+    # from the frame exactly once. float64 holds whole-number counts exactly up to 2^53.
+    # Blank cells count as 0, matching Series.sum()'s NaN-skipping totals.
+    metrics = np.empty((len(df), len(METRIC_COLS)), dtype=np.float64, order='F')
+    for j, col in enumerate(METRIC_COLS):
+        metrics[:, j] = df[col].to_numpy(dtype=np.float64, na_value=0)
+    imp, clk, spend, conv = metrics.T
+
+    fused_stats = _get_fused_stats()
+    if fused_stats is not None:
+        (total_impressions, total_clicks, total_spend, total_conversions,
+         top_idx, best_idx) = fused_stats(imp, clk, spend, conv)
+    else:
+        # Single pass over all four metrics instead of four separate reductions
+        total_impressions, total_clicks, total_spend, total_conversions = metrics.sum(axis=0)
+        # Simple Return on Ad Spend proxy, kept transient so the uploaded frame is not mutated
+        roas_proxy = np.divide(conv, spend, out=np.full(len(spend), -np.inf), where=spend > 0)
+        top_idx, best_idx = conv.argmax(), roas_proxy.argmax()
+        if roas_proxy[best_idx] == -np.inf:
+            best_idx = -1
+
+    top_campaign = df['Campaign_Name'].iat[int(top_idx)]
+    # No row with positive spend means there is no meaningful ROAS winner
+    most_efficient = df['Platform'].iat[int(best_idx)] if best_idx >= 0 else None
+    return total_impressions, total_clicks, total_spend, total_conversions, top_campaign, most_efficient
+
+def _aggregate_polars(df):
+    # One lazy, multithreaded query computes every total and both winners
+    roas_proxy = pl.when(pl.col('Spend') > 0).then(pl.col('Conversions') / pl.col('Spend')).otherwise(float('-inf'))
+    # Blank metric cells count as 0, as on the NumPy path, so both engines pick the same rows
+    return pl.from_pandas(df[METRIC_COLS + ['Campaign_Name', 'Platform']]).lazy().with_columns(
+        pl.col(METRIC_COLS).fill_null(0)
+    ).select([
+        pl.col('Impressions').sum(),
+        pl.col('Clicks').sum(),
+        pl.col('Spend').sum(),
+        pl.col('Conversions').sum(),
+        pl.col('Campaign_Name').get(pl.col('Conversions').arg_max()),
+        # Null (like the NumPy path's None) when no row has positive spend
+        pl.when((pl.col('Spend') > 0).any()).then(pl.col('Platform').get(roas_proxy.arg_max()))
+    ]).collect().row(0)
+
 def analyze_campaign_data(df):
     """
     Performs deterministic calculations on the raw data.
     """
     try:
         # 1. Clean & Validate
-        required_cols = ['Impressions', 'Clicks', 'Spend', 'Conversions']
-        if not all(col in df.columns for col in required_cols):
-            return None, "Missing required columns. Please upload a valid AdTech CSV."
-
-        # 2. Aggregations
-        total_spend = df['Spend'].sum()
-        total_clicks = df['Clicks'].sum()
-        total_conversions = df['Conversions'].sum()
-        total_impressions = df['Impressions'].sum()
+        col_set = set(df.columns)
+        missing = [col for col in METRIC_COLS if col not in col_set]
+        if missing:
+            return None, f"Missing required columns: {', '.join(missing)}. Please upload a valid AdTech CSV."
+        if len(df) == 0:
+            return None, "The uploaded CSV has no campaign rows. Please upload a valid AdTech CSV."
+
+        # 2. Aggregations & Winners (Top Campaign, most efficient Platform)
+        aggregate = _aggregate_polars if USE_POLARS else _aggregate_numpy
+        (total_impressions, total_clicks, total_spend, total_conversions,
+         top_campaign, most_efficient) = aggregate(df)
 
         # 3. Derived Metrics (KPIs)
         ctr = (total_clicks / total_impressions * 100) if total_impressions > 0 else 0
         cpa = total_spend / total_conversions if total_conversions > 0 else 0
         cpc = total_spend / total_clicks if total_clicks > 0 else 0
-        
-        # 4. Identify Winners & Losers
-        df['ROAS_Proxy'] = df['Conversions'] / df['Spend'] # Simple Return on Ad Spend proxy
-        top_campaign = df.loc[df['Conversions'].idxmax()]['Campaign_Name']
-        most_efficient = df.loc[df['ROAS_Proxy'].idxmax()]['Platform']
 
+        # Raw numerics only; formatting happens at the display boundary (see FORMATTERS)
         stats = {
-            "Total Spend": f"${total_spend:,.2f}",
-            "Total Conversions": f"{total_conversions:,}",
-            "Global CTR": f"{ctr:.2f}%",
-            "Avg CPA": f"${cpa:.2f}",
-            "Avg CPC": f"${cpc:.2f}",
-            "Top Campaign": top_campaign,
-            "Best Platform": most_efficient
+            "total_spend": float(total_spend),
+            "total_conversions": float(total_conversions),
+            "ctr": float(ctr),
+            "cpa": float(cpa),
+            "cpc": float(cpc),
+            "top_campaign": str(top_campaign),
+            "best_platform": str(most_efficient) if most_efficient is not None else "N/A"
         }
         return stats, None
 
     except Exception as e:
         return None, f"Data Processing Error: {str(e)}"
 
-# --- AI INSIGHT GENERATOR ---
-def generate_executive_summary(stats, df_head):
+@st.cache_data(show_spinner=False, max_entries=CSV_CACHE_MAX_ENTRIES, ttl=CSV_CACHE_TTL)
+def _analyze(csv_key: str, _data):
+    # The upload's content digest stands in for hashing the whole DataFrame
+    df = _data.to_pandas(types_mapper=pd.ArrowDtype) if USE_PYARROW_IO else _data
+    return analyze_campaign_data(df)
+
+# --- PRESENTATION ---
+STAT_LABELS = {
+    "total_spend": "Total Spend",
+    "total_conversions": "Total Conversions",
+    "ctr": "Global CTR",
+    "cpa": "Avg CPA",
+    "cpc": "Avg CPC",
+    "top_campaign": "Top Campaign",
+    "best_platform": "Best Platform"
+}
+
+def _format_count(value):
+    # Whole counts without decimals; fractional (attributed) conversions keep two places
+    return f"{value:,.0f}" if float(value).is_integer() else f"{value:,.2f}"
+
+FORMATTERS = {
+    "total_spend": "${:,.2f}".format,
+    "total_conversions": _format_count,
+    "ctr": "{:.2f}%".format,
+    "cpa": "${:.2f}".format,
+    "cpc": "${:.2f}".format,
+    "top_campaign": str,
+    "best_platform": str
+}
+
+def format_stats(stats):
     """
-    Basically google gemini api is used to generate insights of the csv data.
+    Renders the raw stats as labelled display strings for the PDF and the AI prompt.
     """
-    if not api_key:
-        return "⚠️ GEMINI_API_KEY is missing. Please check your .env file."
+    return {STAT_LABELS[key]: FORMATTERS[key](value) for key, value in stats.items()}
 
-    try:
-        # Using gemini-2.5-flash for speed and efficiency in the project
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0.5,
-            google_api_key=api_key,
-            convert_system_message_to_human=True # act as a helper for some langchain versions, good to have
-        )
-        
-        template = """
+# --- AI INSIGHT GENERATOR ---
+TEMPLATE = """
         You are a Senior Data Analyst at a top AdTech firm. 
         Write a concise, 3-paragraph executive summary for the Marketing Director based on the following weekly performance data.
 
@@ -89,67 +264,110 @@ def generate_executive_summary(stats, df_head):
         
         Keep the tone professional, objective, and action-oriented.
         """
-        
-        prompt = PromptTemplate(template=template, input_variables=["metrics", "best_platform"])
-        
+_METRIC_FMT = "- {}: {}".format
+
+@st.cache_resource(show_spinner=False)
+def _get_llm():
+    # Built once per process so the client and its HTTP session are reused across reruns.
+    # LangChain is imported here so the first page render doesn't pay for it.
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    # Using gemini-2.5-flash for speed and efficiency in the project
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash",
+        temperature=0.5,
+        google_api_key=api_key,
+        convert_system_message_to_human=True # act as a helper for some langchain versions, good to have
+    )
+
+@st.cache_resource(show_spinner=False)
+def _get_prompt():
+    from langchain.prompts import PromptTemplate
+
+    return PromptTemplate(template=TEMPLATE, input_variables=["metrics", "best_platform"])
+
+def generate_executive_summary(stats, df_head):
+    """
+    Basically google gemini api is used to generate insights of the csv data.
+    """
+    if not api_key:
+        return "⚠️ GEMINI_API_KEY is missing. Please check your .env file."
+
+    try:
+        llm = _get_llm()
+        prompt = _get_prompt()
+
         # Format metrics for the prompt
-        metrics_str = "\n".join([f"- {k}: {v}" for k,v in stats.items()])
-        
-        response = llm.predict(prompt.format(metrics=metrics_str, best_platform=stats['Best Platform']))
-        return response
+        display = format_stats(stats)
+        metrics_str = "\n".join(map(_METRIC_FMT, display.keys(), display.values()))
+
+        response = llm.invoke(prompt.format(metrics=metrics_str, best_platform=stats['best_platform']))
+        return response.content
     
     except Exception as e:
         return f"AI Service Unavailable: {str(e)}"
 
 # --- PDF GENERATION OF THE FINAL ANALYSIS---
-class PDFReport(FPDF):
-    def header(self):
-        # 1. Top Dashboard Bar – GroundTruth style teal
-        # Approx brand teal: rgb(0, 191, 165)
-        self.set_fill_color(0, 191, 165)
-        self.rect(0, 0, 210, 25, 'F')
+def _pdf_report_class():
+    # fpdf is imported on the first report rather than at startup; sys.modules makes
+    # the import free on later calls, and defining the subclass itself is negligible.
+    from fpdf import FPDF
+    from fpdf.enums import XPos, YPos
+
+    class PDFReport(FPDF):
+        def header(self):
+            # 1. Top Dashboard Bar – GroundTruth style teal
+            # Approx brand teal: rgb(0, 191, 165)
+            self.set_fill_color(0, 191, 165)
+            self.rect(0, 0, 210, 25, 'F')
         
-        # 2. Logo / Title Area
-        self.set_y(8)
-        self.set_font('Arial', 'B', 16)
-        self.set_text_color(255, 255, 255)  # White text
-        self.cell(10)  # Left padding
-        self.cell(0, 10, 'ADMINISTRATIVE DASHBOARD | WEEKLY PERFORMANCE', 0, 1, 'L')
+            # 2. Logo / Title Area
+            self.set_y(8)
+            self.set_font('Helvetica', 'B', 16)
+            self.set_text_color(255, 255, 255)  # White text
+            self.cell(10)  # Left padding
+            self.cell(0, 10, 'ADMINISTRATIVE DASHBOARD | WEEKLY PERFORMANCE', border=0, align='L', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
         
-        # 3. Sub-header (Date/Context)
-        self.set_font('Arial', '', 9)
-        # Slightly lighter text, still on teal
-        self.set_text_color(230, 255, 248)
-        self.cell(10)
-        self.cell(0, 0, 'Generated by AdPulse AI Engine', 0, 1, 'L')
-        self.ln(15)
-
-    def footer(self):
-        # Footer Bar – light mint background like website bg
-        self.set_y(-15)
-        # Soft mint / aqua strip
-        self.set_fill_color(220, 247, 240)   # light mint
-        self.rect(0, 282, 210, 15, 'F')
-        self.set_font('Arial', 'I', 8)
-        # Dark teal-ish grey text
-        self.set_text_color(60, 90, 80)
-        self.cell(0, 10, f'Confidential Internal Report | Page {self.page_no()}', 0, 0, 'C')
-
-
-def create_pdf(stats, analysis_text):
-
-    def safe_text(text):
-        return text.encode('latin-1', 'replace').decode('latin-1')
-
-    pdf = PDFReport()
+            # 3. Sub-header (Date/Context)
+            self.set_font('Helvetica', '', 9)
+            # Slightly lighter text, still on teal
+            self.set_text_color(230, 255, 248)
+            self.cell(10)
+            self.cell(0, 0, 'Generated by AdPulse AI Engine', border=0, align='L', new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            self.ln(15)
+
+        def footer(self):
+            # Footer Bar – light mint background like website bg
+            self.set_y(-15)
+            # Soft mint / aqua strip
+            self.set_fill_color(220, 247, 240)   # light mint
+            self.rect(0, 282, 210, 15, 'F')
+            self.set_font('Helvetica', 'I', 8)
+            # Dark teal-ish grey text
+            self.set_text_color(60, 90, 80)
+            self.cell(0, 10, f'Confidential Internal Report | Page {self.page_no()}', border=0, align='C', new_x=XPos.RIGHT, new_y=YPos.TOP)
+
+    return PDFReport
+
+def _safe_text(text):
+    return text.encode('latin-1', 'replace').decode('latin-1')
+
+def build_static_pages(stats):
+    """
+    Renders the deterministic part of the report (KPI cards, top campaign) ahead of the AI narrative.
+    """
+    from fpdf.enums import XPos, YPos
+
+    display = format_stats(stats)
+    pdf = _pdf_report_class()()
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.add_page()
     
     # --- SECTION 1: KPI CARDS ---
-    pdf.set_font("Arial", 'B', 12)
+    pdf.set_font("Helvetica", 'B', 12)
     # Dark teal for headings
     pdf.set_text_color(6, 64, 60)
-    pdf.cell(0, 10, "1. HIGH-LEVEL METRICS", ln=True)
+    pdf.cell(0, 10, "1. HIGH-LEVEL METRICS", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
     pdf.ln(2)
     
     col_width = 60
@@ -157,15 +375,15 @@ def create_pdf(stats, analysis_text):
     spacing = 5
     
     metrics_row_1 = [
-        ("Total Spend", stats.get("Total Spend", "$0")),
-        ("Conversions", stats.get("Total Conversions", "0")),
-        ("Avg CPA", stats.get("Avg CPA", "$0"))
+        ("Total Spend", display.get("Total Spend", "$0")),
+        ("Conversions", display.get("Total Conversions", "0")),
+        ("Avg CPA", display.get("Avg CPA", "$0"))
     ]
     
     metrics_row_2 = [
-        ("Global CTR", stats.get("Global CTR", "0%")),
-        ("Avg CPC", stats.get("Avg CPC", "$0")),
-        ("Best Platform", stats.get("Best Platform", "N/A"))
+        ("Global CTR", display.get("Global CTR", "0%")),
+        ("Avg CPC", display.get("Avg CPC", "$0")),
+        ("Best Platform", display.get("Best Platform", "N/A"))
     ]
 
     def draw_card(x, y, title, value):
@@ -176,17 +394,17 @@ def create_pdf(stats, analysis_text):
         
         # Card label (small, muted)
         pdf.set_xy(x + 2, y + 2)
-        pdf.set_font("Arial", '', 8)
+        pdf.set_font("Helvetica", '', 8)
         pdf.set_text_color(90, 120, 110)       # grey-green label
-        pdf.cell(col_width, 5, safe_text(title.upper()), 0, 0, 'L')
+        pdf.cell(col_width, 5, _safe_text(title.upper()), border=0, align='L', new_x=XPos.RIGHT, new_y=YPos.TOP)
         
         # Card value (bold, dark teal)
         pdf.set_xy(x, y + 10)
-        pdf.set_font("Arial", 'B', 14)
+        pdf.set_font("Helvetica", 'B', 14)
         pdf.set_text_color(6, 64, 60)
         if len(str(value)) > 15:
-            pdf.set_font("Arial", 'B', 10)
-        pdf.cell(col_width, 10, safe_text(str(value)), 0, 0, 'C')
+            pdf.set_font("Helvetica", 'B', 10)
+        pdf.cell(col_width, 10, _safe_text(str(value)), border=0, align='C', new_x=XPos.RIGHT, new_y=YPos.TOP)
 
     start_x = 10
     start_y = pdf.get_y()
@@ -205,30 +423,37 @@ def create_pdf(stats, analysis_text):
     pdf.rect(10, pdf.get_y(), 190, 15, 'F')
 
     pdf.set_xy(15, pdf.get_y() + 4)
-    pdf.set_font("Arial", 'B', 10)
+    pdf.set_font("Helvetica", 'B', 10)
     pdf.set_text_color(6, 64, 60)  # dark teal
 
     label = "TOP CAMPAIGN (WINNER):"
     label_width = pdf.get_string_width(label) + 2
-    pdf.cell(label_width, 8, label, 0, 0)
+    pdf.cell(label_width, 8, label, border=0, new_x=XPos.RIGHT, new_y=YPos.TOP)
     
-    pdf.set_font("Arial", '', 10)
-    pdf.cell(0, 8, safe_text(stats.get("Top Campaign", "N/A")), 0, 1)
+    pdf.set_font("Helvetica", '', 10)
+    pdf.cell(0, 8, _safe_text(display.get("Top Campaign", "N/A")), border=0, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
 
     pdf.ln(10)
+    return pdf
+
+def finalize_pdf(pdf, analysis_text):
+    """
+    Appends the AI narrative to the pages from build_static_pages and returns the finished PDF.
+    """
+    from fpdf.enums import XPos, YPos
 
     # --- SECTION 3: AI EXECUTIVE SUMMARY ---
-    pdf.set_font("Arial", 'B', 12)
+    pdf.set_font("Helvetica", 'B', 12)
     pdf.set_text_color(6, 64, 60)
-    pdf.cell(0, 10, "2. AI STRATEGIC NARRATIVE", ln=True)
+    pdf.cell(0, 10, "2. AI STRATEGIC NARRATIVE", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
     
     start_text_y = pdf.get_y() + 5
-    pdf.set_font("Arial", size=10)
+    pdf.set_font("Helvetica", size=10)
     # Neutral dark text (like site body copy)
     pdf.set_text_color(55, 71, 79)
     pdf.set_xy(15, start_text_y)
     
-    pdf.multi_cell(180, 6, safe_text(analysis_text))
+    pdf.multi_cell(180, 6, _safe_text(analysis_text))
     end_text_y = pdf.get_y()
     
     # Left accent line in brand teal
@@ -236,7 +461,23 @@ def create_pdf(stats, analysis_text):
     pdf.set_draw_color(0, 191, 165)
     pdf.line(12, start_text_y, 12, end_text_y)
     
-    return pdf.output(dest='S').encode('latin-1', 'ignore')
+    # fpdf2 writes straight into the buffer, which st.download_button accepts as-is
+    buf = io.BytesIO()
+    pdf.output(buf)
+    return buf
+
+# --- REPORT PIPELINE ---
+def build_report(stats, df_head):
+    """
+    Builds the static PDF pages in a worker thread while the Gemini request is in flight.
+    """
+    # The blocking Gemini call stays on the script thread, so the cached client is only
+    # ever used from one place and no per-click event loop is needed.
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        static_pages = pool.submit(build_static_pages, stats)
+        summary = generate_executive_summary(stats, df_head)
+        pdf = static_pages.result()
+    return summary, finalize_pdf(pdf, summary)
 
 
 # --- MAIN APPLICATION UI ---
@@ -269,43 +510,53 @@ def main():
         return
     
     # 2. Process Data
-    if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-        st.write("### 🔍 Data Preview")
-        st.dataframe(df.head(5))
-        
-        if st.button("🚀 Generate Executive Report"):
-            with st.spinner("Analyzing performance metrics with Gemini..."):
-                # Step A: Numeric Analysis
-                stats, error = analyze_campaign_data(df)
-                
-                if error:
-                    st.error(error)
-                    return
-
-                # Step B: AI Narrative
-                summary = generate_executive_summary(stats, df.head())
-                
-                # Step C: Display Results
-                st.success("Analysis Complete!")
-                
-                # Metrics Display
-                col1, col2, col3 = st.columns(3)
-                col1.metric("Total Spend", stats['Total Spend'])
-                col2.metric("Conversions", stats['Total Conversions'])
-                col3.metric("CPA", stats['Avg CPA'])
-
-                with st.expander("Read Executive Summary"): 
-                    st.write(summary)
-
-                pdf_bytes = create_pdf(stats, summary)
-                
-                st.download_button(
-                    label="📥 Download Official PDF Report",
-                    data=pdf_bytes,
-                    file_name="Executive_Ad_Report.pdf",
-                    mime="application/pdf"
-                )
+    # Hash the bytes once per upload (file_id is stable across reruns); content-keyed caches
+    # then also hit when the same CSV is uploaded again
+    raw = uploaded_file.getvalue()
+    if st.session_state.get("csv_file_id") != uploaded_file.file_id:
+        st.session_state["csv_file_id"] = uploaded_file.file_id
+        st.session_state["csv_key"] = hashlib.sha256(raw).hexdigest()
+    csv_key = st.session_state["csv_key"]
+    data, error = _load_csv(csv_key, raw)
+    if error:
+        st.error(error)
+        return
+
+    st.write("### 🔍 Data Preview")
+    # Static records preview; slice the Arrow table directly so no pandas frame is built
+    preview = data.slice(0, 5).to_pylist() if USE_PYARROW_IO else data.head(5).to_dict(orient='records')
+    st.table(preview)
+    
+    if st.button("🚀 Generate Executive Report"):
+        with st.spinner("Analyzing performance metrics with Gemini..."):
+            # Step A: Numeric Analysis
+            stats, error = _analyze(csv_key, data)
+            
+            if error:
+                st.error(error)
+                return
+
+            # Step B: AI Narrative + PDF (overlapped)
+            summary, pdf_bytes = build_report(stats, preview)
+            
+            # Step C: Display Results
+            st.success("Analysis Complete!")
+            
+            # Metrics Display
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Total Spend", FORMATTERS['total_spend'](stats['total_spend']))
+            col2.metric("Conversions", FORMATTERS['total_conversions'](stats['total_conversions']))
+            col3.metric("CPA", FORMATTERS['cpa'](stats['cpa']))
+
+            with st.expander("Read Executive Summary"): 
+                st.write(summary)
+
+            st.download_button(
+                label="📥 Download Official PDF Report",
+                data=pdf_bytes,
+                file_name="Executive_Ad_Report.pdf",
+                mime="application/pdf"
+            )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file